@@ -10,43 +10,79 @@ Criteria:
 import re
 import os
 import sys
-import glob
+import math
+import bisect
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 MIN_LINES = 5
+# Below this many files a process pool costs more than it saves
+PARALLEL_MIN_FILES = 16
 
+_RE_VERBATIM = re.compile(r'\\begin\{verbatim\}(.*?)\\end\{verbatim\}', re.DOTALL)
+_RE_SUBSUBSECTION = re.compile(r'\\subsubsection\*?\{[\d.]*\s*(.+?)\}')
+_RE_TEXTBF = re.compile(r'\\textbf\{(.+?)\}')
+# Box-drawing / tree characters, matched as a single character class
+_ART_CHARS = '+|├└┌┐┘┤┬┴┼─│'
+_RE_ART = re.compile('[' + re.escape(_ART_CHARS) + ']')
+_RE_CAPTION_SPECIAL = re.compile(r'([_#&%])')
 
-def is_ascii_art(code):
-    """Check if content is ASCII art (diagrams, file trees)."""
-    lines = [l for l in code.strip().split('\n') if l.strip()]
+
+def is_ascii_art(lines):
+    """Check if the non-empty lines of a block are ASCII art (diagrams, file trees)."""
     if not lines:
         return False
-    art_pattern = re.compile(r'[+|├└┌┐┘┤┬┴┼─│]')
-    art_lines = sum(1 for l in lines if art_pattern.search(l))
-    return art_lines >= len(lines) * 0.3
-
+    # Stop as soon as the 30% threshold is reached or can no longer be reached
+    threshold = math.ceil(len(lines) * 0.3)
+    art_lines = 0
+    remaining = len(lines)
+    for l in lines:
+        remaining -= 1
+        if _RE_ART.search(l):
+            art_lines += 1
+            if art_lines >= threshold:
+                return True
+        elif art_lines + remaining < threshold:
+            return False
+    return False
+
+
+def index_captions(content):
+    """Scan content once for caption sources, for repeated get_caption() lookups."""
+    index = []
+    for pattern in (_RE_SUBSUBSECTION, _RE_TEXTBF):
+        matches = list(pattern.finditer(content))
+        index.append(([m.end() for m in matches], matches))
+    return index
+
+
+def _last_before(entries, pos):
+    """Return the last indexed match that ends at or before pos."""
+    ends, matches = entries
+    i = bisect.bisect_right(ends, pos)
+    return matches[i - 1] if i else None
+
+
+def get_caption(index, pos):
+    """Extract caption from the subsubsection or textbf preceding pos."""
+    subsubsections, textbfs = index
 
-def get_caption(text_before):
-    """Extract caption from preceding subsubsection or textbf."""
     # Most recent \subsubsection*{X.Y.Z. Title}
-    matches = re.findall(r'\\subsubsection\*?\{[\d.]*\s*(.+?)\}', text_before)
-    if matches:
-        return matches[-1].strip()
+    m = _last_before(subsubsections, pos)
+    if m:
+        return m.group(1).strip()
 
-    # Most recent \textbf{Title.}
-    matches = re.findall(r'\\textbf\{(.+?)\}', text_before[-500:])
-    if matches:
-        return matches[-1].strip().rstrip('.')
+    # Most recent \textbf{Title.} within the last 500 characters
+    m = _last_before(textbfs, pos)
+    if m and m.start() >= pos - 500:
+        return m.group(1).strip().rstrip('.')
 
     return 'Фрагмент програмного коду'
 
 
 def escape_caption(text):
     """Escape LaTeX special characters for use in lstlisting caption."""
-    text = text.replace('_', r'\_')
-    text = text.replace('#', r'\#')
-    text = text.replace('&', r'\&')
-    text = text.replace('%', r'\%')
-    return text
+    return _RE_CAPTION_SPECIAL.sub(r'\\\1', text)
 
 
 def process_file(filepath):
@@ -54,44 +90,68 @@ def process_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    pattern = re.compile(r'\\begin\{verbatim\}(.*?)\\end\{verbatim\}', re.DOTALL)
+    # Cheap substring test before running the DOTALL regex over the file
+    if '\\begin{verbatim}' not in content:
+        return 0
 
-    parts = []
-    last_end = 0
     converted = 0
+    captions = None
 
-    for m in pattern.finditer(content):
+    def replace_block(m):
+        nonlocal converted, captions
         code = m.group(1)
         lines = [l for l in code.strip().split('\n') if l.strip()]
 
-        parts.append(content[last_end:m.start()])
-
-        if len(lines) < MIN_LINES or is_ascii_art(code):
-            parts.append(m.group(0))
-        else:
-            caption = get_caption(content[:m.start()])
-            caption = escape_caption(caption)
-            parts.append(f'\\begin{{lstlisting}}[caption={{{caption}}}]')
-            parts.append(code.rstrip())
-            parts.append('\n\\end{lstlisting}')
-            converted += 1
+        if len(lines) < MIN_LINES or is_ascii_art(lines):
+            return m.group(0)
+
+        if captions is None:
+            captions = index_captions(content)
+        caption = get_caption(captions, m.start())
+        caption = escape_caption(caption)
+        converted += 1
+        return f'\\begin{{lstlisting}}[caption={{{caption}}}]{code.rstrip()}\n\\end{{lstlisting}}'
+
+    new_content = _RE_VERBATIM.sub(replace_block, content)
+
+    # Leave unchanged files untouched so their mtimes don't trigger rebuilds.
+    # Write next to the original and swap it in, so a crash mid-write never
+    # leaves a truncated source file behind
+    if new_content != content:
+        tmp_path = filepath + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(new_content)
+        # The tmp file was created with the default mode; keep the original's
+        shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
 
-        last_end = m.end()
+    return converted
 
-    parts.append(content[last_end:])
 
-    if converted > 0:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(''.join(parts))
+def iter_tex_files(src_dir):
+    """Yield paths of all .tex files under src_dir.
 
-    return converted
+    Like the glob pattern it replaces, hidden files and directories are skipped.
+    """
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for fname in files:
+            if fname.endswith('.tex') and not fname.startswith('.'):
+                yield os.path.join(root, fname)
 
 
 def main(src_dir):
     """Process all .tex files in the source directory."""
+    filepaths = sorted(iter_tex_files(src_dir))
+    if len(filepaths) >= PARALLEL_MIN_FILES:
+        # Files are independent; fan the regex work out across cores
+        with ProcessPoolExecutor() as executor:
+            counts = list(executor.map(process_file, filepaths, chunksize=8))
+    else:
+        counts = [process_file(filepath) for filepath in filepaths]
+
     total = 0
-    for filepath in sorted(glob.glob(os.path.join(src_dir, '**/*.tex'), recursive=True)):
-        count = process_file(filepath)
+    for filepath, count in zip(filepaths, counts):
         if count > 0:
             print(f'  {os.path.basename(filepath)}: {count} listings')
             total += count
@@ -5,9 +5,87 @@ from docx import Document
 from docx.shared import Pt, Cm, Mm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.section import WD_ORIENT
+from docx.enum.style import WD_STYLE_TYPE
 from docx.oxml.ns import qn
+from lxml import etree
 import sys
 
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+# Shared style properties. Keys map onto apply_style(); anything left out
+# keeps the value inherited from the default python-docx template.
+_BODY = dict(
+    font_name='Times New Roman', size=Pt(14), line_spacing=1.5,
+    space_before=Pt(0), space_after=Pt(0), first_line_indent=Cm(1.25),
+    alignment=WD_ALIGN_PARAGRAPH.JUSTIFY,
+)
+_HEADING = dict(
+    font_name='Times New Roman', size=Pt(14), bold=True, clear_color=True,
+    alignment=WD_ALIGN_PARAGRAPH.LEFT, line_spacing=1.5,
+)
+_TOC_ENTRY = dict(
+    font_name='Times New Roman', size=Pt(14), line_spacing=1.5,
+    space_before=Pt(0), space_after=Pt(0), first_line_indent=Cm(0),
+)
+_LIST = dict(
+    font_name='Times New Roman', size=Pt(14), line_spacing=1.5,
+    space_before=Pt(0), space_after=Pt(0),
+)
+
+# (style name, create if missing, style type, properties), applied in order.
+# Styles that are not created are only configured if the template has them.
+# Style type: 1 = paragraph, 2 = character.
+STYLE_SPECS = [
+    # Default paragraph style (Body Text / Normal)
+    ('Normal', False, 1, _BODY),
+    # Body Text style (pandoc uses this)
+    ('Body Text', True, 1, _BODY),
+    ('First Paragraph', True, 1, _BODY),
+    # Heading 1: РОЗДІЛ (bold, 14pt, starts on a new page)
+    ('Heading 1', False, 1, dict(
+        _HEADING, space_before=Pt(0), space_after=Pt(12),
+        first_line_indent=Cm(0), page_break_before=True)),
+    # Heading 2: Підрозділ (bold, left with indent, 14pt)
+    ('Heading 2', False, 1, dict(
+        _HEADING, space_before=Pt(12), space_after=Pt(6),
+        first_line_indent=Cm(1.25))),
+    # Heading 3: Пункт (bold, left with indent, 14pt)
+    ('Heading 3', False, 1, dict(
+        _HEADING, space_before=Pt(6), space_after=Pt(6),
+        first_line_indent=Cm(1.25))),
+    ('Heading 4', False, 1, dict(
+        _HEADING, bold=False, first_line_indent=Cm(1.25))),
+    # Caption style (for figures/tables)
+    ('Caption', True, 1, dict(
+        font_name='Times New Roman', size=Pt(14), italic=False,
+        clear_color=True, alignment=WD_ALIGN_PARAGRAPH.CENTER,
+        space_before=Pt(6), space_after=Pt(6), first_line_indent=Cm(0),
+        line_spacing=1.5)),
+    # Figure style (centered images)
+    ('Figure', True, 1, dict(
+        font_name='Times New Roman', size=Pt(14),
+        alignment=WD_ALIGN_PARAGRAPH.CENTER, first_line_indent=Cm(0))),
+    ('TOC Heading', False, 1, dict(
+        font_name='Times New Roman', size=Pt(14), bold=True,
+        alignment=WD_ALIGN_PARAGRAPH.CENTER)),
+    # Source Code style (for verbatim/code blocks)
+    ('Source Code', True, 1, dict(
+        font_name='Courier New', size=Pt(10), line_spacing=1.0,
+        space_before=Pt(0), space_after=Pt(0), first_line_indent=Cm(0),
+        alignment=WD_ALIGN_PARAGRAPH.LEFT)),
+    # Verbatim Char style (inline code character style)
+    ('Verbatim Char', True, 2, dict(
+        font_name='Courier New', size=Pt(10), all_ranges=False)),
+    # TOC entry styles (dot-leader tabs are added separately)
+    ('TOC 1', True, 1, _TOC_ENTRY),
+    ('TOC 2', True, 1, dict(_TOC_ENTRY, left_indent=Cm(1.0))),
+    ('TOC 3', True, 1, dict(_TOC_ENTRY, left_indent=Cm(2.0))),
+    ('List Paragraph', False, 1, _LIST),
+    ('List Bullet', False, 1, _LIST),
+    ('List Number', False, 1, _LIST),
+]
+
 
 def set_font_all_ranges(style, font_name):
     """Set font for ALL character ranges and remove Word theme font overrides.
@@ -45,8 +123,121 @@ def remove_heading_color(style):
             rpr.remove(color)
 
 
+# Schema order of <w:pPr> / <w:rPr> children, so merged properties land
+# where Word expects them.
+_PPR_ORDER = [qn(f'w:{tag}') for tag in (
+    'pStyle', 'keepNext', 'keepLines', 'pageBreakBefore', 'framePr',
+    'widowControl', 'numPr', 'suppressLineNumbers', 'pBdr', 'shd', 'tabs',
+    'suppressAutoHyphens', 'kinsoku', 'wordWrap', 'overflowPunct',
+    'topLinePunct', 'autoSpaceDE', 'autoSpaceDN', 'bidi', 'adjustRightInd',
+    'snapToGrid', 'spacing', 'ind', 'contextualSpacing', 'mirrorIndents',
+    'suppressOverlap', 'jc', 'textDirection', 'textAlignment',
+    'textboxTightWrap', 'outlineLvl', 'divId', 'cnfStyle', 'rPr', 'sectPr',
+    'pPrChange',
+)]
+_RPR_ORDER = [qn(f'w:{tag}') for tag in (
+    'rStyle', 'rFonts', 'b', 'bCs', 'i', 'iCs', 'caps', 'smallCaps', 'strike',
+    'dstrike', 'outline', 'shadow', 'emboss', 'imprint', 'noProof',
+    'snapToGrid', 'vanish', 'webHidden', 'color', 'spacing', 'w', 'kern',
+    'position', 'sz', 'szCs', 'highlight', 'u', 'effect', 'bdr', 'shd',
+    'fitText', 'vertAlign', 'rtl', 'cs', 'em', 'lang', 'eastAsianLayout',
+    'specVanish', 'oMath',
+)]
+# Children whose attributes are merged into an existing element rather than
+# replacing it (the template may already carry other attributes on them).
+_MERGE_ATTRS = {qn('w:rFonts'), qn('w:spacing'), qn('w:ind')}
+
+
+def _on_off(tag, value):
+    """Serialize a CT_OnOff property the way python-docx does."""
+    return f'<w:{tag}/>' if value else f'<w:{tag} w:val="0"/>'
+
+
+def _rpr_xml(spec):
+    """Build the <w:rPr> children for a STYLE_SPECS entry."""
+    font = spec['font_name']
+    parts = [f'<w:rFonts w:ascii="{font}" w:hAnsi="{font}"/>']
+    if 'bold' in spec:
+        parts.append(_on_off('b', spec['bold']))
+    if 'italic' in spec:
+        parts.append(_on_off('i', spec['italic']))
+    parts.append(f'<w:sz w:val="{int(spec["size"].pt * 2)}"/>')
+    return ''.join(parts)
+
+
+def _ppr_xml(spec):
+    """Build the <w:pPr> children for a STYLE_SPECS entry."""
+    parts = []
+    if spec.get('page_break_before'):
+        parts.append('<w:pageBreakBefore/>')
+    spacing = ''
+    if 'space_before' in spec:
+        spacing += f' w:before="{spec["space_before"].twips}"'
+    if 'space_after' in spec:
+        spacing += f' w:after="{spec["space_after"].twips}"'
+    if 'line_spacing' in spec:
+        spacing += f' w:line="{int(spec["line_spacing"] * 240)}" w:lineRule="auto"'
+    if spacing:
+        parts.append(f'<w:spacing{spacing}/>')
+    ind = ''
+    if 'left_indent' in spec:
+        ind += f' w:left="{spec["left_indent"].twips}"'
+    if 'first_line_indent' in spec:
+        ind += f' w:firstLine="{spec["first_line_indent"].twips}"'
+    if ind:
+        parts.append(f'<w:ind{ind}/>')
+    if 'alignment' in spec:
+        parts.append(f'<w:jc w:val="{WD_ALIGN_PARAGRAPH.to_xml(spec["alignment"])}"/>')
+    return ''.join(parts)
+
+
+def _merge_props(parent, children_xml, order):
+    """Merge children parsed from one XML snippet into parent.
+
+    Existing children with the same tag are replaced (or, for _MERGE_ATTRS
+    tags, updated in place); new ones are inserted in schema order.
+    """
+    new = etree.fromstring(f'<w:x xmlns:w="{W_NS}">{children_xml}</w:x>')
+    for child in list(new):
+        old = parent.find(child.tag)
+        if old is not None and child.tag in _MERGE_ATTRS:
+            for key, value in child.attrib.items():
+                old.set(key, value)
+            continue
+        if old is not None:
+            parent.remove(old)
+        rank = order.index(child.tag)
+        for i, existing in enumerate(parent):
+            if existing.tag in order and order.index(existing.tag) > rank:
+                parent.insert(i, child)
+                break
+        else:
+            parent.append(child)
+
+
+def apply_style(style, spec):
+    """Apply one STYLE_SPECS property dict to a style.
+
+    Builds the run/paragraph property children with a single lxml parse
+    each instead of going through python-docx's per-property descriptors.
+    """
+    rPr = style.element.get_or_add_rPr()
+    _merge_props(rPr, _rpr_xml(spec), _RPR_ORDER)
+    if spec.get('all_ranges', True):
+        set_font_all_ranges(style, spec['font_name'])
+    if spec.get('clear_color'):
+        remove_heading_color(style)
+
+    if style.type != WD_STYLE_TYPE.PARAGRAPH:
+        return
+    ppr_xml = _ppr_xml(spec)
+    if ppr_xml:
+        _merge_props(style.element.get_or_add_pPr(), ppr_xml, _PPR_ORDER)
+
+
 def create_reference_doc(output_path):
     doc = Document()
+    existing_styles = {s.name for s in doc.styles}
 
     # --- Page setup ---
     section = doc.sections[0]
@@ -80,152 +271,19 @@ def create_reference_doc(output_path):
         run.font.name = 'Times New Roman'
         run.font.size = Pt(14)
 
-    # --- Default paragraph style (Body Text / Normal) ---
-    style = doc.styles['Normal']
-    style.font.name = 'Times New Roman'
-    style.font.size = Pt(14)
-    set_font_all_ranges(style, 'Times New Roman')
-    pf = style.paragraph_format
-    pf.line_spacing = 1.5
-    pf.space_before = Pt(0)
-    pf.space_after = Pt(0)
-    pf.first_line_indent = Cm(1.25)
-    pf.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-    # --- Body Text style (pandoc uses this) ---
-    if 'Body Text' not in [s.name for s in doc.styles]:
-        body_style = doc.styles.add_style('Body Text', 1)  # 1 = paragraph
-    else:
-        body_style = doc.styles['Body Text']
-    body_style.font.name = 'Times New Roman'
-    body_style.font.size = Pt(14)
-    set_font_all_ranges(body_style, 'Times New Roman')
-    body_style.paragraph_format.line_spacing = 1.5
-    body_style.paragraph_format.space_before = Pt(0)
-    body_style.paragraph_format.space_after = Pt(0)
-    body_style.paragraph_format.first_line_indent = Cm(1.25)
-    body_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-    # --- First Paragraph style ---
-    if 'First Paragraph' not in [s.name for s in doc.styles]:
-        fp_style = doc.styles.add_style('First Paragraph', 1)
-    else:
-        fp_style = doc.styles['First Paragraph']
-    fp_style.font.name = 'Times New Roman'
-    fp_style.font.size = Pt(14)
-    set_font_all_ranges(fp_style, 'Times New Roman')
-    fp_style.paragraph_format.line_spacing = 1.5
-    fp_style.paragraph_format.space_before = Pt(0)
-    fp_style.paragraph_format.space_after = Pt(0)
-    fp_style.paragraph_format.first_line_indent = Cm(1.25)
-    fp_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-    # --- Heading 1: РОЗДІЛ (bold, ALL CAPS, centered, 14pt) ---
-    h1 = doc.styles['Heading 1']
-    h1.font.name = 'Times New Roman'
-    h1.font.size = Pt(14)
-    h1.font.bold = True
-    h1.font.color.rgb = None
-    set_font_all_ranges(h1, 'Times New Roman')
-    remove_heading_color(h1)
-    h1.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    h1.paragraph_format.space_before = Pt(0)
-    h1.paragraph_format.space_after = Pt(12)
-    h1.paragraph_format.first_line_indent = Cm(0)
-    h1.paragraph_format.line_spacing = 1.5
-    h1.paragraph_format.page_break_before = True
-
-    # --- Heading 2: Підрозділ (bold, left with indent, 14pt) ---
-    h2 = doc.styles['Heading 2']
-    h2.font.name = 'Times New Roman'
-    h2.font.size = Pt(14)
-    h2.font.bold = True
-    h2.font.color.rgb = None
-    set_font_all_ranges(h2, 'Times New Roman')
-    remove_heading_color(h2)
-    h2.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    h2.paragraph_format.space_before = Pt(12)
-    h2.paragraph_format.space_after = Pt(6)
-    h2.paragraph_format.first_line_indent = Cm(1.25)
-    h2.paragraph_format.line_spacing = 1.5
-
-    # --- Heading 3: Пункт (bold, left with indent, 14pt) ---
-    h3 = doc.styles['Heading 3']
-    h3.font.name = 'Times New Roman'
-    h3.font.size = Pt(14)
-    h3.font.bold = True
-    h3.font.color.rgb = None
-    set_font_all_ranges(h3, 'Times New Roman')
-    remove_heading_color(h3)
-    h3.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    h3.paragraph_format.space_before = Pt(6)
-    h3.paragraph_format.space_after = Pt(6)
-    h3.paragraph_format.first_line_indent = Cm(1.25)
-    h3.paragraph_format.line_spacing = 1.5
-
-    # --- Heading 4 (if exists) ---
-    if 'Heading 4' in [s.name for s in doc.styles]:
-        h4 = doc.styles['Heading 4']
-        h4.font.name = 'Times New Roman'
-        h4.font.size = Pt(14)
-        h4.font.bold = False
-        h4.font.color.rgb = None
-        set_font_all_ranges(h4, 'Times New Roman')
-        remove_heading_color(h4)
-        h4.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        h4.paragraph_format.first_line_indent = Cm(1.25)
-        h4.paragraph_format.line_spacing = 1.5
-
-    # --- Caption style (for figures/tables) ---
-    if 'Caption' not in [s.name for s in doc.styles]:
-        cap_style = doc.styles.add_style('Caption', 1)
-    else:
-        cap_style = doc.styles['Caption']
-    cap_style.font.name = 'Times New Roman'
-    cap_style.font.size = Pt(14)
-    cap_style.font.italic = False
-    cap_style.font.color.rgb = None
-    set_font_all_ranges(cap_style, 'Times New Roman')
-    cap_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    cap_style.paragraph_format.space_before = Pt(6)
-    cap_style.paragraph_format.space_after = Pt(6)
-    cap_style.paragraph_format.first_line_indent = Cm(0)
-    cap_style.paragraph_format.line_spacing = 1.5
-
-    # --- Figure style (centered images) ---
-    if 'Figure' not in [s.name for s in doc.styles]:
-        fig_style = doc.styles.add_style('Figure', 1)
-    else:
-        fig_style = doc.styles['Figure']
-    fig_style.font.name = 'Times New Roman'
-    fig_style.font.size = Pt(14)
-    set_font_all_ranges(fig_style, 'Times New Roman')
-    fig_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    fig_style.paragraph_format.first_line_indent = Cm(0)
-
-    # --- Table of Contents heading ---
-    if 'TOC Heading' in [s.name for s in doc.styles]:
-        toc = doc.styles['TOC Heading']
-        toc.font.name = 'Times New Roman'
-        toc.font.size = Pt(14)
-        toc.font.bold = True
-        set_font_all_ranges(toc, 'Times New Roman')
-        toc.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    # --- Source Code style (for verbatim/code blocks) ---
-    if 'Source Code' not in [s.name for s in doc.styles]:
-        sc_style = doc.styles.add_style('Source Code', 1)  # paragraph style
-    else:
-        sc_style = doc.styles['Source Code']
-    sc_style.font.name = 'Courier New'
-    sc_style.font.size = Pt(10)
-    set_font_all_ranges(sc_style, 'Courier New')
-    sc_style.paragraph_format.line_spacing = 1.0
-    sc_style.paragraph_format.space_before = Pt(0)
-    sc_style.paragraph_format.space_after = Pt(0)
-    sc_style.paragraph_format.first_line_indent = Cm(0)
-    sc_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    # Add border/shading via XML for visual distinction
+    # --- Styles from STYLE_SPECS ---
+    styles = {}
+    for name, create, style_type, spec in STYLE_SPECS:
+        if name not in existing_styles:
+            if not create:
+                continue
+            doc.styles.add_style(name, style_type)
+            existing_styles.add(name)
+        styles[name] = doc.styles[name]
+        apply_style(styles[name], spec)
+
+    # --- Source Code: border/shading via XML for visual distinction ---
+    sc_style = styles['Source Code']
     pPr = sc_style.element.find(qn('w:pPr'))
     if pPr is None:
         pPr = sc_style.element.makeelement(qn('w:pPr'), {})
@@ -243,33 +301,12 @@ def create_reference_doc(output_path):
     })
     pPr.append(ind)
 
-    # --- Verbatim Char style (inline code character style) ---
-    if 'Verbatim Char' not in [s.name for s in doc.styles]:
-        vc_style = doc.styles.add_style('Verbatim Char', 2)  # 2 = character style
-    else:
-        vc_style = doc.styles['Verbatim Char']
-    vc_style.font.name = 'Courier New'
-    vc_style.font.size = Pt(10)
-
-    # --- TOC entry styles (with dot leaders) ---
+    # --- TOC entries: right tab stop with dot leader for page numbers ---
     # Text width: 210mm - 30mm(left) - 10mm(right) = 170mm
     # In twips: 170mm * (1440/25.4) ≈ 9638
     text_width_twips = 9638
-    for level, indent_cm in [('TOC 1', 0), ('TOC 2', 1.0), ('TOC 3', 2.0)]:
-        if level not in [s.name for s in doc.styles]:
-            toc_entry = doc.styles.add_style(level, 1)
-        else:
-            toc_entry = doc.styles[level]
-        toc_entry.font.name = 'Times New Roman'
-        toc_entry.font.size = Pt(14)
-        set_font_all_ranges(toc_entry, 'Times New Roman')
-        toc_entry.paragraph_format.line_spacing = 1.5
-        toc_entry.paragraph_format.space_before = Pt(0)
-        toc_entry.paragraph_format.space_after = Pt(0)
-        toc_entry.paragraph_format.first_line_indent = Cm(0)
-        if indent_cm > 0:
-            toc_entry.paragraph_format.left_indent = Cm(indent_cm)
-        # Right tab stop with dot leader for page numbers
+    for level in ('TOC 1', 'TOC 2', 'TOC 3'):
+        toc_entry = styles[level]
         pPr_toc = toc_entry.element.find(qn('w:pPr'))
         if pPr_toc is None:
             pPr_toc = toc_entry.element.makeelement(qn('w:pPr'), {})
@@ -283,17 +320,6 @@ def create_reference_doc(output_path):
         tabs.append(tab)
         pPr_toc.append(tabs)
 
-    # --- List styles ---
-    for list_style_name in ['List Paragraph', 'List Bullet', 'List Number']:
-        if list_style_name in [s.name for s in doc.styles]:
-            ls = doc.styles[list_style_name]
-            ls.font.name = 'Times New Roman'
-            ls.font.size = Pt(14)
-            set_font_all_ranges(ls, 'Times New Roman')
-            ls.paragraph_format.line_spacing = 1.5
-            ls.paragraph_format.space_before = Pt(0)
-            ls.paragraph_format.space_after = Pt(0)
-
     # Add a sample paragraph to ensure styles are applied
     p = doc.add_paragraph('', style='Normal')
     p.clear()
@@ -5,96 +5,128 @@ Strips all LaTeX commands, keeps only readable text and math."""
 import re
 import sys
 
+# Patterns are compiled once at import; extract_text() runs per file.
+_RE_COMMENT = re.compile(r'(?<!\\)%.*$', re.MULTILINE)
+_RE_BEGIN_DOC = re.compile(r'\\begin\{document\}')
+_RE_END_DOC = re.compile(r'\\end\{document\}')
+
+_RE_EQUATION = re.compile(r'\\(begin|end)\{equation\}')
+_EQ_MARKERS = {'begin': '[EQ]', 'end': '[/EQ]'}
+
+# Begin and end stay separate passes, begin first: removing a begin can
+# join an \end with the {..} after it (\end\begin{table}x}{table})
+_RE_BEGIN_FLOAT = re.compile(r'\\begin\{(?:figure|table|longtable|tabular)\}[^}]*\}?\s*')
+_RE_END_FLOAT = re.compile(r'\\end\{(?:figure|table|longtable|tabular)\}')
+
+# One pass for all longtable/minipage boilerplate; each alternative drops the
+# rest of its line except \end{minipage}, which is removed on its own.
+_RE_LONGTABLE_NOISE = re.compile(
+    r'\\(?:toprule|midrule|bottomrule|endhead|endfirsthead|endlastfoot'
+    r'|tabularnewline|begin\{minipage\}).*$'
+    r'|\\end\{minipage\}',
+    re.MULTILINE,
+)
+
+# One pass per level, in this order: a title can contain a deeper heading
+_RE_SECTION = re.compile(r'\\section\*?\{([^}]+)\}')
+_RE_SUBSECTION = re.compile(r'\\subsection\*?\{([^}]+)\}')
+_RE_SUBSUBSECTION = re.compile(r'\\subsubsection\*?\{([^}]+)\}')
+
+_RE_CAPTION = re.compile(r'\\caption\{([^}]+)\}')
+
+_RE_TEXTBF = re.compile(r'\\textbf\{([^}]+)\}')
+_RE_TEXTIT = re.compile(r'\\textit\{([^}]+)\}')
+_RE_TEXTTT = re.compile(r'\\texttt\{([^}]+)\}')
+_RE_EMPH = re.compile(r'\\emph\{([^}]+)\}')
+
+# Labels go first; \ref{\label{x}} must see the label already removed
+_RE_LABEL = re.compile(r'\\label\{[^}]+\}')
+_RE_REF = re.compile(r'\\ref\{([^}]+)\}')
+_RE_HYPERREF = re.compile(r'\\hyperref\[([^\]]+)\]\{[^}]*\}')
+
+_RE_INCLUDEGRAPHICS = re.compile(r'\\includegraphics\[[^\]]*\]\{[^}]+\}')
+
+_RE_LAYOUT_CMD = re.compile(r'\\(?:centering|hline|newpage|noindent|clearpage|pagebreak)\b')
+_RE_BEGIN_END = re.compile(r'\\(?:begin|end)\{[^}]+\}')
+_RE_ITEM = re.compile(r'\\item\b')
+_RE_SPACING_CMD = re.compile(r'\\(?:hfill|vfill|vspace|hspace)\{[^}]*\}')
+_RE_DEFINITION = re.compile(r'\\(?:def|let|renewcommand|newcommand)[^{]*\{[^}]*\}')
+
+_RE_BARE_CMD = re.compile(r'\\[a-zA-Z]+\b(?!\{)')
+
+# Single-character cleanups: drop braces, ~ becomes a space
+_CLEANUP_TRANS = str.maketrans({'{': '', '}': '', '~': ' '})
+_RE_HSPACE = re.compile(r'[ \t]+')
+# Whitespace around a newline (same set str.strip() removes, minus '\n')
+_RE_LINE_TRIM = re.compile(r'[^\S\n]*\n[^\S\n]*')
+_RE_BLANK_RUN = re.compile(r'\n{3,}')
+
 
 def extract_text(tex):
     # Remove comments
-    tex = re.sub(r'(?<!\\)%.*$', '', tex, flags=re.MULTILINE)
+    tex = _RE_COMMENT.sub('', tex)
 
     # Remove preamble (everything before \begin{document})
-    m = re.search(r'\\begin\{document\}', tex)
+    m = _RE_BEGIN_DOC.search(tex)
     if m:
         tex = tex[m.end():]
-    m = re.search(r'\\end\{document\}', tex)
+    m = _RE_END_DOC.search(tex)
     if m:
         tex = tex[:m.start()]
 
     # Normalize equation environments to a marker
-    tex = re.sub(r'\\begin\{equation\}', '[EQ]', tex)
-    tex = re.sub(r'\\end\{equation\}', '[/EQ]', tex)
-
-    # Keep math content but mark it
-    tex = re.sub(r'\$([^$]+)\$', r'$\1$', tex)
+    tex = _RE_EQUATION.sub(lambda m: _EQ_MARKERS[m.group(1)], tex)
 
     # Remove figure/table environments but keep captions
-    tex = re.sub(r'\\begin\{(figure|table|longtable|tabular)\}[^}]*\}?\s*', '', tex)
-    tex = re.sub(r'\\end\{(figure|table|longtable|tabular)\}', '', tex)
+    tex = _RE_BEGIN_FLOAT.sub('', tex)
+    tex = _RE_END_FLOAT.sub('', tex)
 
     # Remove longtable boilerplate
-    tex = re.sub(r'\\toprule.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\midrule.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\bottomrule.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\endhead.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\endfirsthead.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\endlastfoot.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\tabularnewline.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\begin\{minipage\}.*$', '', tex, flags=re.MULTILINE)
-    tex = re.sub(r'\\end\{minipage\}', '', tex)
+    tex = _RE_LONGTABLE_NOISE.sub('', tex)
 
     # Extract section titles
-    tex = re.sub(r'\\section\*?\{([^}]+)\}', r'\n## \1\n', tex)
-    tex = re.sub(r'\\subsection\*?\{([^}]+)\}', r'\n### \1\n', tex)
-    tex = re.sub(r'\\subsubsection\*?\{([^}]+)\}', r'\n#### \1\n', tex)
+    tex = _RE_SECTION.sub(r'\n## \1\n', tex)
+    tex = _RE_SUBSECTION.sub(r'\n### \1\n', tex)
+    tex = _RE_SUBSUBSECTION.sub(r'\n#### \1\n', tex)
 
     # Extract caption text
-    tex = re.sub(r'\\caption\{([^}]+)\}', r'[Caption: \1]', tex)
+    tex = _RE_CAPTION.sub(r'[Caption: \1]', tex)
 
     # Extract text from formatting commands
-    tex = re.sub(r'\\textbf\{([^}]+)\}', r'\1', tex)
-    tex = re.sub(r'\\textit\{([^}]+)\}', r'\1', tex)
-    tex = re.sub(r'\\texttt\{([^}]+)\}', r'\1', tex)
-    tex = re.sub(r'\\emph\{([^}]+)\}', r'\1', tex)
+    tex = _RE_TEXTBF.sub(r'\1', tex)
+    tex = _RE_TEXTIT.sub(r'\1', tex)
+    tex = _RE_TEXTTT.sub(r'\1', tex)
+    tex = _RE_EMPH.sub(r'\1', tex)
 
     # Remove labels, refs (keep ref target)
-    tex = re.sub(r'\\label\{[^}]+\}', '', tex)
-    tex = re.sub(r'\\ref\{([^}]+)\}', r'[ref:\1]', tex)
-    tex = re.sub(r'\\hyperref\[([^\]]+)\]\{[^}]*\}', r'[ref:\1]', tex)
+    tex = _RE_LABEL.sub('', tex)
+    tex = _RE_REF.sub(r'[ref:\1]', tex)
+    tex = _RE_HYPERREF.sub(r'[ref:\1]', tex)
 
     # Remove includegraphics
-    tex = re.sub(r'\\includegraphics\[[^\]]*\]\{[^}]+\}', '[IMAGE]', tex)
+    tex = _RE_INCLUDEGRAPHICS.sub('[IMAGE]', tex)
 
     # Remove remaining LaTeX commands but keep their text arguments
-    tex = re.sub(r'\\(?:centering|hline|newpage|noindent|clearpage|pagebreak)\b', '', tex)
-    tex = re.sub(r'\\(?:begin|end)\{[^}]+\}', '', tex)
-    tex = re.sub(r'\\item\b', '- ', tex)
-    tex = re.sub(r'\\(?:hfill|vfill|vspace|hspace)\{[^}]*\}', '', tex)
-    tex = re.sub(r'\\(?:def|let|renewcommand|newcommand)[^{]*\{[^}]*\}', '', tex)
+    tex = _RE_LAYOUT_CMD.sub('', tex)
+    tex = _RE_BEGIN_END.sub('', tex)
+    tex = _RE_ITEM.sub('- ', tex)
+    tex = _RE_SPACING_CMD.sub('', tex)
+    tex = _RE_DEFINITION.sub('', tex)
 
     # Remove remaining backslash commands without args
-    tex = re.sub(r'\\[a-zA-Z]+\b(?!\{)', '', tex)
+    tex = _RE_BARE_CMD.sub('', tex)
 
     # Clean up
-    tex = re.sub(r'\{|\}', '', tex)
-    tex = re.sub(r'&', ' | ', tex)
-    tex = re.sub(r'\\\\', '', tex)
-    tex = re.sub(r'~', ' ', tex)
-    tex = re.sub(r'\n{3,}', '\n\n', tex)
-    tex = re.sub(r'[ \t]+', ' ', tex)
-
-    # Strip each line
-    lines = [line.strip() for line in tex.split('\n')]
-    # Remove empty lines that are consecutive
-    result = []
-    prev_empty = False
-    for line in lines:
-        if not line:
-            if not prev_empty:
-                result.append('')
-            prev_empty = True
-        else:
-            result.append(line)
-            prev_empty = False
-
-    return '\n'.join(result).strip()
+    tex = tex.translate(_CLEANUP_TRANS)
+    tex = tex.replace('&', ' | ')
+    tex = tex.replace('\\\\', '')
+    tex = _RE_HSPACE.sub(' ', tex)
+
+    # Strip each line, then keep at most one empty line in a row
+    tex = _RE_LINE_TRIM.sub('\n', tex)
+    tex = _RE_BLANK_RUN.sub('\n\n', tex)
+
+    return tex.strip()
 
 
 if __name__ == '__main__':
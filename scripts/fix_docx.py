@@ -3,61 +3,122 @@
 
 import sys
 import os
+import copy
+import functools
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
-from docx.oxml.ns import qn
+from docx.oxml.ns import qn, nsmap
 from docx.oxml import OxmlElement
+import docx.oxml.parser
+from lxml import etree
+
+# Compiled lookups and resolved attribute names, shared by every call below
+NSMAP = {'w': nsmap['w']}
+_RPR_XPATH = etree.XPath('w:rPr', namespaces=NSMAP)
+_RFONTS_XPATH = etree.XPath('w:rPr/w:rFonts', namespaces=NSMAP)
+_PPR_XPATH = etree.XPath('w:pPr', namespaces=NSMAP)
+_TABS_XPATH = etree.XPath('w:tabs', namespaces=NSMAP)
+_FONT_ATTRS = [qn(f'w:{a}') for a in ('ascii', 'hAnsi', 'cs', 'eastAsia')]
+_THEME_ATTRS = [qn(f'w:{a}') for a in ('asciiTheme', 'hAnsiTheme', 'cstheme', 'eastAsiaTheme')]
+W_VAL = qn('w:val')
+W_UPDATE_FIELDS = qn('w:updateFields')
+
+# Text width = 210mm - 30mm(left) - 10mm(right) = 170mm ≈ 9638 twips.
+TEXT_WIDTH_TWIPS = 9638
+
+
+def _make_element(tag, attrs=None, text=None):
+    """Build an OxmlElement with qn-prefixed attributes (used for templates)."""
+    elem = OxmlElement(tag)
+    for key, value in (attrs or {}).items():
+        elem.set(qn(key), value)
+    if text is not None:
+        elem.text = text
+    return elem
+
+
+# Prebuilt XML skeletons, deep-copied wherever they are needed
+_TOC_TABS_TEMPLATE = _make_element('w:tabs')
+_TOC_TABS_TEMPLATE.append(_make_element('w:tab', {
+    'w:val': 'right', 'w:leader': 'dot', 'w:pos': str(TEXT_WIDTH_TWIPS),
+}))
+_FLD_BEGIN = _make_element('w:fldChar', {'w:fldCharType': 'begin'})
+_FLD_SEPARATE = _make_element('w:fldChar', {'w:fldCharType': 'separate'})
+_FLD_END = _make_element('w:fldChar', {'w:fldCharType': 'end'})
+_TOC_INSTR = _make_element('w:instrText', {'xml:space': 'preserve'},
+                           ' TOC \\o "1-3" \\h \\z \\u ')
+
+
+@functools.lru_cache(maxsize=None)
+def _rfonts_template(font_name):
+    """<w:rFonts> with font_name set on all four character ranges."""
+    return _make_element('w:rFonts', {
+        'w:ascii': font_name, 'w:hAnsi': font_name,
+        'w:cs': font_name, 'w:eastAsia': font_name,
+    })
+
+
+def _use_large_document_parser():
+    """Swap python-docx's part parser for one tuned to multi-MB document.xml.
+
+    Same options and element classes as python-docx's own parser, plus
+    huge_tree (no libxml2 size limits) and collect_ids=False (no xml:id
+    table, we only navigate by tag).
+    """
+    parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False,
+                             huge_tree=True, collect_ids=False)
+    parser.set_element_class_lookup(docx.oxml.parser.element_class_lookup)
+    docx.oxml.parser.oxml_parser = parser
+
+
+def _set_font_ranges(parent, font_name, rpr_first):
+    """Set font on all character ranges of parent's <w:rPr>, creating it if needed.
+
+    rpr_first puts a new <w:rPr> first among parent's children (required for
+    runs); otherwise it is appended (styles).
+    """
+    found = _RFONTS_XPATH(parent)
+    if found:
+        rFonts = found[0]
+    else:
+        found = _RPR_XPATH(parent)
+        if found:
+            rPr = found[0]
+        else:
+            rPr = OxmlElement('w:rPr')
+            if rpr_first:
+                parent.insert(0, rPr)
+            else:
+                parent.append(rPr)
+        rPr.insert(0, copy.deepcopy(_rfonts_template(font_name)))
+        return
+    for key in _FONT_ATTRS:
+        rFonts.set(key, font_name)
+    for key in _THEME_ATTRS:
+        rFonts.attrib.pop(key, None)
 
 
 def set_run_font(run, font_name='Times New Roman'):
     """Set font on all character ranges for a run."""
-    rPr = run._r.find(qn('w:rPr'))
-    if rPr is None:
-        rPr = OxmlElement('w:rPr')
-        run._r.insert(0, rPr)
-    rFonts = rPr.find(qn('w:rFonts'))
-    if rFonts is None:
-        rFonts = OxmlElement('w:rFonts')
-        rPr.insert(0, rFonts)
-    for attr in ['ascii', 'hAnsi', 'cs', 'eastAsia']:
-        rFonts.set(qn(f'w:{attr}'), font_name)
-    for attr in ['asciiTheme', 'hAnsiTheme', 'cstheme', 'eastAsiaTheme']:
-        key = qn(f'w:{attr}')
-        if key in rFonts.attrib:
-            del rFonts.attrib[key]
+    _set_font_ranges(run._r, font_name, rpr_first=True)
 
 
 def set_style_font(style, font_name='Times New Roman'):
     """Set font on all character ranges for a style."""
-    rPr = style.element.find(qn('w:rPr'))
-    if rPr is None:
-        rPr = OxmlElement('w:rPr')
-        style.element.append(rPr)
-    rFonts = rPr.find(qn('w:rFonts'))
-    if rFonts is None:
-        rFonts = OxmlElement('w:rFonts')
-        rPr.insert(0, rFonts)
-    for attr in ['ascii', 'hAnsi', 'cs', 'eastAsia']:
-        rFonts.set(qn(f'w:{attr}'), font_name)
-    for attr in ['asciiTheme', 'hAnsiTheme', 'cstheme', 'eastAsiaTheme']:
-        key = qn(f'w:{attr}')
-        if key in rFonts.attrib:
-            del rFonts.attrib[key]
+    _set_font_ranges(style.element, font_name, rpr_first=False)
 
 
 def configure_toc_styles(doc):
-    """Create/update TOC 1/2/3 styles with right tab stop + dot leader.
-
-    Text width = 210mm - 30mm(left) - 10mm(right) = 170mm ≈ 9638 twips.
-    """
-    text_width_twips = 9638
-
+    """Create/update TOC 1/2/3 styles with right tab stop + dot leader."""
+    styles = doc.styles
+    existing_names = {s.name for s in styles}
     for level, indent_cm in [('TOC 1', 0), ('TOC 2', 1.0), ('TOC 3', 2.0)]:
-        if level not in [s.name for s in doc.styles]:
-            toc_style = doc.styles.add_style(level, 1)  # paragraph style
+        if level not in existing_names:
+            toc_style = styles.add_style(level, 1)  # paragraph style
+            existing_names.add(level)
         else:
-            toc_style = doc.styles[level]
+            toc_style = styles[level]
 
         toc_style.font.name = 'Times New Roman'
         toc_style.font.size = Pt(14)
@@ -70,24 +131,20 @@ def configure_toc_styles(doc):
             toc_style.paragraph_format.left_indent = Cm(indent_cm)
 
         # Ensure pPr exists
-        pPr = toc_style.element.find(qn('w:pPr'))
-        if pPr is None:
+        found = _PPR_XPATH(toc_style.element)
+        if found:
+            pPr = found[0]
+        else:
             pPr = OxmlElement('w:pPr')
             toc_style.element.append(pPr)
 
         # Remove any existing tabs
-        existing_tabs = pPr.find(qn('w:tabs'))
-        if existing_tabs is not None:
-            pPr.remove(existing_tabs)
+        found = _TABS_XPATH(pPr)
+        if found:
+            pPr.remove(found[0])
 
         # Add right tab stop with dot leader
-        tabs = OxmlElement('w:tabs')
-        tab = OxmlElement('w:tab')
-        tab.set(qn('w:val'), 'right')
-        tab.set(qn('w:leader'), 'dot')
-        tab.set(qn('w:pos'), str(text_width_twips))
-        tabs.append(tab)
-        pPr.append(tabs)
+        pPr.append(copy.deepcopy(_TOC_TABS_TEMPLATE))
 
 
 def add_para(doc, text='', alignment=WD_ALIGN_PARAGRAPH.CENTER, bold=False,
@@ -126,22 +183,15 @@ def add_toc_field(doc):
 
     # Begin field
     run1 = p.add_run()
-    fldChar1 = OxmlElement('w:fldChar')
-    fldChar1.set(qn('w:fldCharType'), 'begin')
-    run1._r.append(fldChar1)
+    run1._r.append(copy.deepcopy(_FLD_BEGIN))
 
     # Field instruction
     run2 = p.add_run()
-    instrText = OxmlElement('w:instrText')
-    instrText.set(qn('xml:space'), 'preserve')
-    instrText.text = ' TOC \\o "1-3" \\h \\z \\u '
-    run2._r.append(instrText)
+    run2._r.append(copy.deepcopy(_TOC_INSTR))
 
     # Separator
     run3 = p.add_run()
-    fldChar2 = OxmlElement('w:fldChar')
-    fldChar2.set(qn('w:fldCharType'), 'separate')
-    run3._r.append(fldChar2)
+    run3._r.append(copy.deepcopy(_FLD_SEPARATE))
 
     # Placeholder (replaced automatically when Word opens the document)
     run4 = p.add_run('(Зміст оновиться автоматично)')
@@ -151,9 +201,7 @@ def add_toc_field(doc):
 
     # End field
     run5 = p.add_run()
-    fldChar3 = OxmlElement('w:fldChar')
-    fldChar3.set(qn('w:fldCharType'), 'end')
-    run5._r.append(fldChar3)
+    run5._r.append(copy.deepcopy(_FLD_END))
 
     return p
 
@@ -243,6 +291,7 @@ def build_toc_page(doc):
 
 def fix_docx(input_path, output_path, src_dir):
     """Add formatted title page and TOC to DOCX."""
+    _use_large_document_parser()
     doc = Document(input_path)
     body = doc.element.body
 
@@ -251,11 +300,11 @@ def fix_docx(input_path, output_path, src_dir):
 
     # Tell Word to auto-update all fields (including TOC) when document opens
     settings = doc.settings.element
-    update_fields = settings.find(qn('w:updateFields'))
+    update_fields = settings.find(W_UPDATE_FIELDS)
     if update_fields is None:
         update_fields = OxmlElement('w:updateFields')
         settings.append(update_fields)
-    update_fields.set(qn('w:val'), 'true')
+    update_fields.set(W_VAL, 'true')
 
     # Build title page and TOC elements (added at end of document)
     title_elements = build_title_page(doc, src_dir)
@@ -263,10 +312,10 @@ def fix_docx(input_path, output_path, src_dir):
 
     all_new = title_elements + toc_elements
 
-    # Move all new elements to the beginning of the document
-    for i, elem in enumerate(all_new):
-        body.remove(elem)
-        body.insert(i, elem)
+    # Move all new elements to the beginning of the document in one relink
+    # (remove+insert per element walks the child list each time)
+    moved = set(all_new)
+    body[:] = all_new + [child for child in body if child not in moved]
 
     doc.save(output_path)
     print(f"  Title page and TOC added: {output_path}")
@@ -14,27 +14,77 @@
 import re
 import sys
 import os
-import glob
 import hashlib
+import mmap
+import pickle
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for file hashing/copying; both release the GIL during I/O
+IO_WORKERS = min(8, os.cpu_count() or 4)
+LABEL_CACHE_NAME = '.label-cache.pickle'
+PREAMBLE_SCAN_CHARS = 4096
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.svg')
+
+# Patterns are compiled once at import; each fix runs over the whole document.
+_RE_DISPLAY_SINGLE = re.compile(r'^\\\[(.+?)\\\]$', re.MULTILINE)
+_RE_DISPLAY_MULTI = re.compile(r'\\\[\s*\n(.*?)\n\s*\\\]', re.DOTALL)
+_EQUATION_REPL = r'\\begin{equation}\n\1\n\\end{equation}'
+_RE_INLINE_MATH = re.compile(r'\\\(((?:[^\\]|\\.)*?)\\\)')
+# First \subsection on any line that mentions one of these titles (anywhere)
+_RE_PROMOTE = re.compile(
+    r'^(?=[^\n]*(?:ПРАКТИЧНА ЧАСТИНА|ПРОГРАМНА РЕАЛІЗАЦІЯ|Опис експериментального стенду))'
+    r'([^\n]*?)\\subsection',
+    re.MULTILINE,
+)
+_RE_TOC_SEC = re.compile(r'\\section\{Table of Contents\}\\label\{[^}]*\}\s*\n?')
+
+# Token-local fixes fused into one scan: \hyperref[label]{N} → \ref{label},
+# and baked-in numbers stripped from section titles (\section{N Title},
+# \subsection{N.N Title}, \subsubsection{N.N.N. Title} and
+# \subsubsection{N.N.N.N. Title}, and the \texorpdfstring variants).
+# Each alternative is wrapped in one named group so that
+# m.lastgroup names the fix that matched.
+_RE_TOKEN_FIXES = re.compile(
+    r'(?P<hyperref>\\hyperref\[(?P<ref_label>[^\]]+)\]\{[^}]*\})'
+    r'|(?P<section>\\section\{\d+\s+)'
+    # A stripped \subsection{N.N ...} can expose a \texorpdfstring{N.N ...}
+    # that the sequential passes would strip too; take both in one match.
+    r'|(?P<subsection>\\subsection\{\d+\.\d+\s+'
+    r'(?P<tex_tail>\\texorpdfstring\{\d+\.\d+\s+)?)'
+    r'|(?P<texorpdf>\\subsection\{\\texorpdfstring\{\d+\.\d+\s+)'
+    r'|(?P<subsubsection>\\subsubsection\{\d+(?:\.\d+){2,3}\.?\s*)'
+)
+# Literal prefixes of the _RE_TOKEN_FIXES alternatives; a cheap `in` check
+# for each lets main() skip the scan when none can match
+_TOKEN_ANCHORS = ('\\hyperref[', '\\section{', '\\subsection{', '\\subsubsection{')
+_TOKEN_REPL = {
+    'section': '\\section{',
+    'subsection': '\\subsection{',
+    'texorpdf': '\\subsection{\\texorpdfstring{',
+    'subsubsection': '\\subsubsection{',
+}
+
+# Fixes that must see the promoted hierarchy, fused the same way: pandoc's
+# "\item\n  Text" list items rejoined as "\item Text", and ВСТУП, ВИСНОВКИ,
+# СПИСОК ВИКОРИСТАНИХ ДЖЕРЕЛ made unnumbered (\section*)
+_RE_LAYOUT_FIXES = re.compile(
+    r'(?P<list_item>\\item\s*\n\s+)'
+    r'|(?P<unnumbered>\\section\{(?P<title>ВСТУП|ВИСНОВКИ|СПИСОК ВИКОРИСТАНИХ ДЖЕРЕЛ)\})'
+)
+
+_RE_SOURCE_LABEL = re.compile(
+    r'(?P<caption_label>\\caption\{(?P<caption>[^}]+)\}\s*\\label\{(?P<label>[^}]+)\})'
+    r'|(?P<equation_label>\\begin\{equation\}\s*\\label\{(?P<eq_label>[^}]+)\})'
+)
 
 
 def fix_display_math(text):
     r"""Convert \[...\] to \begin{equation}...\end{equation}"""
     # Single-line: \[...\]
-    text = re.sub(
-        r'^\\\[(.+?)\\\]$',
-        r'\\begin{equation}\n\1\n\\end{equation}',
-        text,
-        flags=re.MULTILINE,
-    )
+    text = _RE_DISPLAY_SINGLE.sub(_EQUATION_REPL, text)
     # Multi-line: \[ ... \]
-    text = re.sub(
-        r'\\\[\s*\n(.*?)\n\s*\\\]',
-        r'\\begin{equation}\n\1\n\\end{equation}',
-        text,
-        flags=re.DOTALL,
-    )
+    text = _RE_DISPLAY_MULTI.sub(_EQUATION_REPL, text)
     return text
 
 
@@ -42,158 +92,181 @@ def fix_inline_math(text):
     r"""Convert \(...\) back to $...$"""
     # Match paired \( ... \) only — use non-greedy match
     # Handle nested parens like \(f(t)\) correctly
-    text = re.sub(r'\\\(((?:[^\\]|\\.)*?)\\\)', r'$\1$', text)
-    return text
-
-
-def fix_hyperref(text):
-    r"""Convert \hyperref[label]{N} to \ref{label}"""
-    text = re.sub(r'\\hyperref\[([^\]]+)\]\{[^}]*\}', r'\\ref{\1}', text)
+    text = _RE_INLINE_MATH.sub(r'$\1$', text)
     return text
 
 
 def fix_en_dashes(text):
     """Convert -- back to Unicode en-dash – (matching original source)."""
     # Only outside of math environments and LaTeX commands
-    # Replace standalone -- (not ---) with –
-    text = re.sub(r'(?<!-)--(?!-)', '–', text)
-    return text
-
-
-def fix_list_formatting(text):
-    """Fix list items split across lines by pandoc (- on separate line)."""
-    # Pattern: \item\n  followed by text on next line → \item text on same line
-    # In the round-tripped output, enumerate items look like:
-    #   \item
-    #     Text here
-    # Should be: \item Text here
-    text = re.sub(r'(\\item)\s*\n\s+', r'\1 ', text)
-    return text
-
-
-def strip_section_numbers(text):
-    """Strip baked-in numbers from section titles."""
-    # \section{N Title} → \section{Title}
-    text = re.sub(
-        r'(\\section\{)\d+\s+',
-        r'\1',
-        text,
-    )
-    # \subsection{N.N Title} → \subsection{Title}
-    text = re.sub(
-        r'(\\subsection\{)\d+\.\d+\s+',
-        r'\1',
-        text,
-    )
-    # \subsubsection{N.N.N. Title} and \subsubsection{N.N.N.N. Title}
-    text = re.sub(
-        r'(\\subsubsection\{)\d+(?:\.\d+){2,3}\.?\s*',
-        r'\1',
-        text,
-    )
-    # Also handle \texorpdfstring variants
-    text = re.sub(
-        r'(\\subsection\{\\texorpdfstring\{)\d+\.\d+\s+',
-        r'\1',
-        text,
-    )
-    return text
+    # Replace standalone -- (not ---) with –. A str.find loop over the '--'
+    # hits is much faster than the (?<!-)--(?!-) regex walking every char.
+    out = []
+    i = 0
+    n = len(text)
+    find = text.find
+    while True:
+        j = find('--', i)
+        if j < 0:
+            out.append(text[i:])
+            break
+        if (j > 0 and text[j - 1] == '-') or (j + 2 < n and text[j + 2] == '-'):
+            # Part of --- (or longer): leave it, resume after this pair
+            out.append(text[i:j + 2])
+        else:
+            out.append(text[i:j])
+            out.append('–')
+        i = j + 2
+    return ''.join(out)
+
+
+def _token_fix(m):
+    kind = m.lastgroup
+    if kind == 'hyperref':
+        # Section stripping ran after \hyperref → \ref, so the label gets it too
+        return '\\ref{' + _RE_TOKEN_FIXES.sub(_token_fix, m.group('ref_label')) + '}'
+    if kind == 'subsection' and m.group('tex_tail'):
+        return _TOKEN_REPL['texorpdf']
+    return _TOKEN_REPL[kind]
+
+
+def fix_tokens(text):
+    r"""Rewrite \hyperref as \ref and strip section title numbers in a single scan."""
+    return _RE_TOKEN_FIXES.sub(_token_fix, text)
+
+
+def _layout_fix(m):
+    if m.lastgroup == 'list_item':
+        return '\\item '
+    return f'\\section*{{{m.group("title")}}}'
+
+
+def fix_layout(text):
+    """Rejoin split list items and unnumber the fixed sections in a single scan."""
+    return _RE_LAYOUT_FIXES.sub(_layout_fix, text)
 
 
 def fix_section_hierarchy(text):
     """Promote specific subsections to sections based on known titles."""
-    # These subsections should be \section level
-    promote_patterns = [
-        r'ПРАКТИЧНА ЧАСТИНА',
-        r'ПРОГРАМНА РЕАЛІЗАЦІЯ',
-        r'Опис експериментального стенду',
-    ]
-    lines = text.split('\n')
-    result = []
-    for line in lines:
-        promoted = False
-        for pattern in promote_patterns:
-            if re.search(pattern, line) and '\\subsection' in line:
-                line = line.replace('\\subsection', '\\section', 1)
-                promoted = True
-                break
-        result.append(line)
-    return '\n'.join(result)
-
-
-def fix_unnumbered_sections(text):
-    r"""Make ВСТУП, ВИСНОВКИ, СПИСОК ВИКОРИСТАНИХ ДЖЕРЕЛ unnumbered (\section*)."""
-    unnumbered = [
-        'ВСТУП',
-        'ВИСНОВКИ',
-        'СПИСОК ВИКОРИСТАНИХ ДЖЕРЕЛ',
-    ]
-    for title in unnumbered:
-        text = re.sub(
-            rf'\\section\{{({title})\}}',
-            rf'\\section*{{\1}}',
-            text,
-        )
-    return text
+    # These subsections should be \section level; one scan, no line split
+    return _RE_PROMOTE.sub(r'\1\\section', text)
 
 
 def remove_toc_section(text):
     """Remove spurious 'Table of Contents' section at the top."""
-    text = re.sub(
-        r'\\section\{Table of Contents\}\\label\{[^}]*\}\s*\n?',
-        '',
-        text,
-    )
-    return text
-
+    return _RE_TOC_SEC.sub('', text)
+
+
+def iter_files(root, exts=None, recursive=True):
+    """Yield paths of regular files under root whose name ends with one of exts.
+
+    Like the glob patterns it replaces, hidden files and directories are
+    skipped and the extension match is case-sensitive.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.is_file() and (exts is None or entry.name.endswith(exts)):
+                    yield entry.path
+
+
+def _labels_in_file(fpath):
+    r"""\label{} names in one .tex file -> caption text or '__equation__'."""
+    with open(fpath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # \caption{...}\label{...} pairs and \label{} near \begin{equation}, in one
+    # scan; equation labels still win over caption labels of the same name
+    captions = {}
+    equations = {}
+    for m in _RE_SOURCE_LABEL.finditer(content):
+        if m.lastgroup == 'caption_label':
+            captions[m.group('label').strip()] = m.group('caption').strip()
+        else:
+            equations[m.group('eq_label')] = '__equation__'
+    captions.update(equations)
+    return captions
+
+
+def extract_labels_from_sources(src_dir, cache_path=None):
+    r"""Extract \label{} and their surrounding context from original .tex files.
+
+    With cache_path, per-file results are pickled there keyed by
+    (mtime_ns, size), and unchanged files are not re-read on the next run.
+    """
+    cache = {}
+    if cache_path:
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            # Missing, truncated, stale or foreign pickle: just rebuild it
+            cache = {}
+        if not isinstance(cache, dict):
+            cache = {}
 
-def extract_labels_from_sources(src_dir):
-    r"""Extract \label{} and their surrounding context from original .tex files."""
     labels = {}  # label_name -> caption or nearby text for matching
-    tex_files = glob.glob(os.path.join(src_dir, '**', '*.tex'), recursive=True)
-
-    for fpath in tex_files:
-        with open(fpath, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Find \caption{...}\label{...} pairs
-        for m in re.finditer(
-            r'\\caption\{([^}]+)\}\s*\\label\{([^}]+)\}', content
-        ):
-            caption_text = m.group(1).strip()
-            label_name = m.group(2).strip()
-            labels[label_name] = caption_text
-
-        # Find \label{} near \begin{equation}
-        for m in re.finditer(
-            r'\\begin\{equation\}\s*\\label\{([^}]+)\}', content
-        ):
-            labels[m.group(1)] = '__equation__'
+    new_cache = {}
+    for fpath in iter_files(src_dir, ('.tex',)):
+        st = os.stat(fpath)
+        key = (st.st_mtime_ns, st.st_size)
+        entry = cache.get(fpath)
+        if (isinstance(entry, tuple) and len(entry) == 2 and entry[0] == key
+                and isinstance(entry[1], dict)):
+            file_labels = entry[1]
+        else:
+            file_labels = _labels_in_file(fpath)
+        new_cache[fpath] = (key, file_labels)
+        labels.update(file_labels)
+
+    if cache_path and new_cache != cache:
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(new_cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
 
     return labels
 
 
 def restore_labels(text, labels):
     r"""Re-insert \label{} after \caption{} lines by matching caption text."""
+    # Each label goes after the first caption with its text. Labels sharing a
+    # caption all land on that first one, the last-listed nearest the caption.
+    pending = {}
     for label_name, caption_text in labels.items():
-        if caption_text == '__equation__':
-            continue
-        # Escape special regex chars in caption
-        escaped = re.escape(caption_text)
-        # Find caption without a label and add one
-        pattern = rf'(\\caption\{{{escaped}\}})'
-        replacement = rf'\1\\label{{{label_name}}}'
-        text = re.sub(pattern, replacement, text, count=1)
-    return text
+        if caption_text != '__equation__':
+            pending.setdefault(caption_text, []).insert(0, label_name)
+    if not pending:
+        return text
+
+    def add_labels(m):
+        names = pending.pop(m.group(1), None)
+        if names is None:  # caption already labelled at its first occurrence
+            return m.group(0)
+        return m.group(0) + ''.join(f'\\label{{{name}}}' for name in names)
+
+    # Captions hold no '}', so at most one alternative can match at any position
+    pattern = re.compile(
+        r'\\caption\{(' + '|'.join(map(re.escape, pending)) + r')\}'
+    )
+    return pattern.sub(add_labels, text)
 
 
-def md5_file(path):
-    """Compute MD5 hash of a file."""
-    h = hashlib.md5()
+def fast_hash(path):
+    """Compute a 128-bit BLAKE2b digest of a file (raw bytes, for dict keys)."""
+    h = hashlib.blake2b(digest_size=16)
     with open(path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            h.update(chunk)
-    return h.hexdigest()
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+    return h.digest()
 
 
 def build_image_mapping(src_dir, media_dir):
@@ -201,59 +274,86 @@ def build_image_mapping(src_dir, media_dir):
     if not media_dir or not os.path.isdir(media_dir):
         return {}
 
+    originals = list(iter_files(src_dir, IMAGE_EXTS, recursive=False))
+    media = list(iter_files(media_dir))
+
+    # Hash everything in one pool: file reads and hashlib release the GIL
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+        hashes = list(ex.map(fast_hash, originals + media))
+
     # Hash all original images in src_dir
     original_by_hash = {}
-    for ext in ('*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg'):
-        for fpath in glob.glob(os.path.join(src_dir, ext)):
-            h = md5_file(fpath)
-            original_by_hash[h] = os.path.basename(fpath)
+    for fpath, h in zip(originals, hashes):
+        original_by_hash[h] = os.path.basename(fpath)
 
-    # Hash all round-tripped images and build mapping
+    # Match round-tripped images against them
     mapping = {}
-    for fpath in glob.glob(os.path.join(media_dir, '**', '*'), recursive=True):
-        if not os.path.isfile(fpath):
-            continue
-        h = md5_file(fpath)
+    for fpath, h in zip(media, hashes[len(originals):]):
         if h in original_by_hash:
             mapping[fpath] = original_by_hash[h]
 
     return mapping
 
 
+def _copy_is_current(src, dest):
+    """True if dest exists with src's size and mtime (as left by shutil.copy2)."""
+    try:
+        dest_st = os.stat(dest)
+    except FileNotFoundError:
+        return False
+    src_st = os.stat(src)
+    return (dest_st.st_size, dest_st.st_mtime_ns) == (src_st.st_size, src_st.st_mtime_ns)
+
+
 def fix_image_paths(text, mapping, output_dir):
     """Replace rIdXX paths with original filenames and copy images to output dir."""
     images_dir = os.path.join(output_dir, 'images')
     os.makedirs(images_dir, exist_ok=True)
 
+    # Every spelling of each rId path -> its replacement, first mapping wins
+    replacements = {}
+    copies = {}  # dest -> source, one copy per destination
     for rId_path, original_name in mapping.items():
         # Copy original image to output images/ dir
-        dest = os.path.join(images_dir, original_name)
-        if not os.path.exists(dest):
-            shutil.copy2(rId_path, dest)
+        copies.setdefault(os.path.join(images_dir, original_name), rId_path)
 
-        # Replace all occurrences of the rId path in the text
-        # The path in the .tex file may be relative, find the actual reference
-        text = text.replace(rId_path, f'images/{original_name}')
-
-        # Also try with just the relative portion that pandoc might use
+        # The path in the .tex file may be relative, so besides the rId path
+        # itself also match the relative portions that pandoc might use
         # e.g. build/latex/media/media/rId9.png
+        new_path = f'images/{original_name}'
         basename = os.path.basename(rId_path)
         parent = os.path.basename(os.path.dirname(rId_path))
         grandparent = os.path.basename(os.path.dirname(os.path.dirname(rId_path)))
         for variant in [
+            rId_path,
             f'{grandparent}/{parent}/{basename}',
             f'{parent}/{basename}',
             basename,
         ]:
-            if variant in text:
-                text = text.replace(variant, f'images/{original_name}')
+            replacements.setdefault(variant, new_path)
 
-    return text
+    # Skip destinations that already hold a copy with the same size and
+    # mtime; copy2 carries the mtime over so the next run can tell
+    jobs = [(src, dest) for dest, src in copies.items() if not _copy_is_current(src, dest)]
+    if jobs:
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+            list(ex.map(lambda job: shutil.copy2(*job), jobs))
+
+    if not replacements:
+        return text
+
+    # One scan for all of them; longest alternatives first so a full path
+    # wins over its own suffixes
+    pattern = re.compile('|'.join(
+        map(re.escape, sorted(replacements, key=len, reverse=True))
+    ))
+    return pattern.sub(lambda m: replacements[m.group(0)], text)
 
 
 def add_preamble(text):
     """Add a basic preamble if the document has none."""
-    if '\\documentclass' not in text:
+    # \documentclass, when present, opens the file; don't scan the whole body
+    if '\\documentclass' not in text[:PREAMBLE_SCAN_CHARS]:
         preamble = r"""\documentclass[14pt,a4paper]{extarticle}
 
 \usepackage{fontspec}
@@ -317,49 +417,52 @@ def main():
 
     output_dir = os.path.dirname(output_file)
 
-    # Apply fixes in order
-    print("  [1/11] Removing spurious ToC section...")
-    text = remove_toc_section(text)
-
-    print("  [2/11] Fixing display math: \\[...\\] → equation...")
-    text = fix_display_math(text)
-
-    print("  [3/11] Fixing inline math: \\(...\\) → $...$...")
-    text = fix_inline_math(text)
+    # Apply fixes in order, skipping passes whose anchor text is absent
+    print("  [1/9] Removing spurious ToC section...")
+    if '\\section{Table of Contents}' in text:
+        text = remove_toc_section(text)
 
-    print("  [4/11] Fixing \\hyperref → \\ref...")
-    text = fix_hyperref(text)
+    print("  [2/9] Fixing display math: \\[...\\] → equation...")
+    if '\\[' in text:
+        text = fix_display_math(text)
 
-    print("  [5/11] Stripping baked-in section numbers...")
-    text = strip_section_numbers(text)
+    print("  [3/9] Fixing inline math: \\(...\\) → $...$...")
+    if '\\(' in text:
+        text = fix_inline_math(text)
 
-    print("  [6/11] Fixing section hierarchy...")
-    text = fix_section_hierarchy(text)
+    print("  [4/9] Fixing \\hyperref → \\ref and section numbers...")
+    if any(anchor in text for anchor in _TOKEN_ANCHORS):
+        text = fix_tokens(text)
 
-    print("  [7/11] Fixing en-dashes...")
-    text = fix_en_dashes(text)
+    print("  [5/9] Fixing section hierarchy...")
+    if '\\subsection' in text:
+        text = fix_section_hierarchy(text)
 
-    print("  [8/11] Fixing list formatting...")
-    text = fix_list_formatting(text)
+    print("  [6/9] Fixing en-dashes...")
+    if '--' in text:
+        text = fix_en_dashes(text)
 
-    print("  [9/11] Fixing unnumbered sections (ВСТУП, ВИСНОВКИ, etc.)...")
-    text = fix_unnumbered_sections(text)
+    print("  [7/9] Fixing list formatting and unnumbered sections (ВСТУП, ВИСНОВКИ, etc.)...")
+    if '\\item' in text or '\\section{' in text:
+        text = fix_layout(text)
 
     if src_dir:
-        print("  [10/11] Restoring \\label{} from original sources...")
-        labels = extract_labels_from_sources(src_dir)
-        text = restore_labels(text, labels)
+        print("  [8/9] Restoring \\label{} from original sources...")
+        labels = extract_labels_from_sources(
+            src_dir, cache_path=os.path.join(output_dir, LABEL_CACHE_NAME))
+        if '\\caption{' in text:
+            text = restore_labels(text, labels)
         print(f"         Restored {len(labels)} labels")
     else:
-        print("  [10/11] Skipping label restoration (no --src-dir)")
+        print("  [8/9] Skipping label restoration (no --src-dir)")
 
     if src_dir and media_dir:
-        print("  [11/11] Fixing image paths...")
+        print("  [9/9] Fixing image paths...")
         mapping = build_image_mapping(src_dir, media_dir)
         text = fix_image_paths(text, mapping, output_dir)
         print(f"         Mapped {len(mapping)} images back to originals")
     else:
-        print("  [11/11] Skipping image path fix (no --src-dir or --media-dir)")
+        print("  [9/9] Skipping image path fix (no --src-dir or --media-dir)")
 
     print("  Adding preamble...")
     text = add_preamble(text)
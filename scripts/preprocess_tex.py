@@ -11,21 +11,104 @@
 import re
 import sys
 import os
+import functools
+import hashlib
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+# Below this many files the process pool costs more than it saves
+PARALLEL_MIN_FILES = 16
+# Whole files are read and written in one go; a large buffer keeps that to
+# one syscall each instead of 8 KB pieces
+IO_BUFFER = 1 << 20
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.svg')
+# Preprocessed output of unchanged files, kept inside the output dir
+CACHE_DIR_NAME = '.preprocess-cache'
+# Per-source stat/listing record from the last project run, also in the output dir
+INDEX_NAME = '.preprocess-index.pickle'
+
+
+def _script_digest():
+    # Part of every cache key, so editing any pass invalidates the cache
+    with open(__file__, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).digest()
+
+
+_SCRIPT_DIGEST = _script_digest()
+
+# Same letters as the old [а-яА-ЯіІїЇєЄґҐ] class (no ё/Ё); set tests beat
+# re.search on the short strings these are checked against. Content stays
+# UTF-8 bytes throughout; only a non-ASCII \text group is decoded for the test.
+_CYRILLIC = frozenset(map(chr, range(0x410, 0x450))) | frozenset('іІїЇєЄґҐ')
+# The same letters plus '_' as UTF-8 sequences, for the subscript patterns:
+# Є І Ї А-п, р-я є і ї, Ґ ґ
+_CYRILLIC_SUB_BYTES = (
+    rb'(?:\xd0[\x84\x86\x87\x90-\xbf]|\xd1[\x80-\x8f\x94\x96\x97]|\xd2[\x90\x91]|_)'
+)
+
+# Patterns are compiled once at import; every pass runs over each file.
+# A required literal between two [^}]* runs is checked with a lookahead, so
+# an unclosed group costs one scan rather than one per candidate split.
+_RE_TEXT_CMD = re.compile(rb'\\text\{([^}]+)\}')
+_RE_ESCAPED_SUB = re.compile(rb'_\{(?=[^}]*\\_)[^}]*\}')
+# [H]/[H!] plus the bare or braced H typo forms
+_RE_FIGURE_H = re.compile(rb'\\begin\{figure\}(?:\{?[Hh]!?\}?|\[H!?\])')
+# Only Cyrillic-only subscripts (one trailing newline allowed) are
+# rewritten, so the regex does the filtering instead of a callback per
+# subscript. A non-Cyrillic one is skipped unless it contains '{': then a
+# later _{ or ^{ sits inside it and must not start a match of its own.
+_RE_SUBSCRIPT = re.compile(
+    rb'([_^])\{(' + _CYRILLIC_SUB_BYTES + rb'+\n?)\}'
+    rb'|[_^]\{(?=[^}]*\{)[^}]*\}'
+)
+_RE_TITLEFORMAT = re.compile(
+    rb'\\titleformat\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}'
+)
+_RE_TITLEPAGE = re.compile(rb'\\begin\{titlepage\}.*?\\end\{titlepage\}', re.DOTALL)
+_RE_TOC_TITLEFONT = re.compile(rb'\\renewcommand\{\\cfttoctitlefont\}.*')
+_RE_TOC_AFTERTITLE = re.compile(rb'\\renewcommand\{\\cftaftertoctitle\}.*')
+_RE_CONTENTSNAME = re.compile(rb'\\renewcommand\{\\contentsname\}.*')
+_RE_SETCOUNTER_PAGE = re.compile(rb'\\setcounter\{page\}\{.*?\}')
+_RE_LABEL = re.compile(rb'\\label\{([^}]+)\}')
+
+# One scan for the math/label passes of preprocess_file. Every math and
+# label pattern above runs from its opening brace to the first '}', so
+# a region matched here contains every match the sequential passes would
+# make inside it; _fix_region replays those passes on the region alone.
+# A plain _{...}/^{...} with neither '\\' nor '{' inside needs no replay:
+# only the Cyrillic subscript pass applies to it (cyrsub), and otherwise
+# nothing, and no other match can start inside it, so it isn't matched.
+# Figure placement stays a separate, earlier pass: a region can run on to
+# the '}' of a \begin{figure}, which would hide the [H] after it.
+_RE_INLINE = re.compile(
+    rb'(?P<cyrsub>[_^]\{' + _CYRILLIC_SUB_BYTES + rb'+\n?\})'
+    rb'|(?P<region>(?:\\text|\\label)\{[^}]+\}|[_^]\{(?=[^}]*[\\{])[^}]*\})'
+)
+# Literal prefixes of the _RE_INLINE alternatives
+_INLINE_ANCHORS = (b'_{', b'^{', b'\\text{', b'\\label{')
+_RE_CHAPTER = re.compile(rb'\\subsubsection\*?\{(\d+)\.')
+_RE_LSTLISTING = re.compile(
+    rb'\\begin\{lstlisting\}\[caption=\{(.+?)\}\]\s*(.*?)\\end\{lstlisting\}',
+    re.DOTALL
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _text_in_math(inner):
+    # If it contains Cyrillic, use a space-separated plain text approach.
+    # Most \text groups in math are ASCII; isascii() settles those in C.
+    if not inner.isascii() and not _CYRILLIC.isdisjoint(inner.decode('utf-8')):
+        # Replace with just the text outside of math context
+        return b'\\textrm{' + inner + b'}'
+    return b'\\text{' + inner + b'}'
 
 
 def fix_math_text_commands(content):
     r"""Replace \text{Cyrillic} with pandoc-safe alternatives inside math."""
     # \text{Ukrainian text} → \textrm{Ukrainian text} inside math
     # texmath handles \textrm better than \text for non-ASCII
-    def replace_text_in_math(match):
-        inner = match.group(1)
-        # If it contains Cyrillic, use a space-separated plain text approach
-        if re.search(r'[а-яА-ЯіІїЇєЄґҐ]', inner):
-            # Replace with just the text outside of math context
-            return f'\\textrm{{{inner}}}'
-        return match.group(0)
-
-    content = re.sub(r'\\text\{([^}]+)\}', replace_text_in_math, content)
+    content = _RE_TEXT_CMD.sub(lambda m: _text_in_math(m.group(1)), content)
     return content
 
 
@@ -33,34 +116,49 @@ def fix_escaped_underscores_in_math(content):
     r"""Fix V_{q\_rms} → V_{q\text{\_}rms} patterns in math."""
     # Replace \_ inside subscripts/superscripts with a comma or hyphen
     # This pattern: stuff_{...\_...} → stuff_{...-...}
-    def fix_subscript(match):
-        return match.group(0).replace('\\_', '{\\text{-}}')
-
-    content = re.sub(r'_\{[^}]*\\_[^}]*\}', fix_subscript, content)
+    content = _RE_ESCAPED_SUB.sub(_dash_escaped_underscores, content)
     return content
 
 
+def _dash_escaped_underscores(match):
+    return match.group(0).replace(b'\\_', b'{\\text{-}}')
+
+
 def fix_figure_placement(content):
     r"""Fix \begin{figure}[H] → \begin{figure}[htbp] and remove stray H."""
-    content = re.sub(r'\\begin\{figure\}\{?[Hh]!?\}?', r'\\begin{figure}[htbp]', content)
-    content = re.sub(r'\\begin\{figure\}\[H!?\]', r'\\begin{figure}[htbp]', content)
+    if b'\\begin{figure}' not in content:
+        return content
+    content = _RE_FIGURE_H.sub(rb'\\begin{figure}[htbp]', content)
     return content
 
 
+@functools.lru_cache(maxsize=4096)
+def _textrm_subscript(sub):
+    # _{перенапруга} → _{\textrm{перенапруга}}; the same terms recur across
+    # a thesis, so each distinct subscript is only built once
+    return sub[:2] + b'\\textrm{' + sub[2:-1] + b'}}'
+
+
+def _cyrillic_sub(m):
+    # Group 2 is only set for a purely Cyrillic subscript; the other
+    # alternative just consumes a nested one unchanged
+    if m.lastindex:
+        return _textrm_subscript(m.group(0))
+    return m.group(0)
+
+
 def fix_cyrillic_subscripts(content):
     """Wrap bare Cyrillic subscripts: V_{перенапруга} → V_{\\text{перенапруга}}"""
-    def wrap_cyrillic_sub(match):
-        prefix = match.group(1)
-        inner = match.group(2)
-        # If the inner content is purely Cyrillic (no existing \text wrapper)
-        if re.match(r'^[а-яА-ЯіІїЇєЄґҐ_]+$', inner) and '\\text' not in inner:
-            return f'{prefix}{{\\textrm{{{inner}}}}}'
-        return match.group(0)
-
-    content = re.sub(r'([_^])\{([^}]+)\}', wrap_cyrillic_sub, content)
+    content = _RE_SUBSCRIPT.sub(_cyrillic_sub, content)
     return content
 
 
+def listing_chapter(content):
+    """Chapter number used for Лістинг captions in this file (0 if unknown)."""
+    chapter_match = _RE_CHAPTER.search(content)
+    return int(chapter_match.group(1)) if chapter_match else 0
+
+
 def convert_lstlisting_for_pandoc(content, listing_counter):
     r"""Convert \begin{lstlisting}[caption={...}] to captioned \begin{verbatim} for pandoc.
 
@@ -69,11 +167,10 @@ def convert_lstlisting_for_pandoc(content, listing_counter):
         listing_counter: dict {chapter_num: count} shared across files
     """
     # Detect chapter number from subsubsection numbering (e.g. \subsubsection*{3.1.1. ...})
-    chapter_match = re.search(r'\\subsubsection\*?\{(\d+)\.', content)
-    chapter_num = int(chapter_match.group(1)) if chapter_match else 0
+    chapter_num = listing_chapter(content)
 
     def replace_listing(m):
-        caption = m.group(1)
+        caption = m.group(1).decode('utf-8')
         code = m.group(2)
         # Clean LaTeX escapes for pandoc
         caption = caption.replace(r'\_', '_').replace(r'\#', '#')
@@ -84,113 +181,318 @@ def convert_lstlisting_for_pandoc(content, listing_counter):
         listing_counter[chapter_num] += 1
         num = f"{chapter_num}.{listing_counter[chapter_num]}"
         cap_line = f"\\begin{{center}}\n\\textbf{{Лістинг {num} --- {caption}}}\n\\end{{center}}\n"
-        return f"{cap_line}\\begin{{verbatim}}{code}\\end{{verbatim}}"
+        return cap_line.encode('utf-8') + b'\\begin{verbatim}' + code + b'\\end{verbatim}'
 
-    pattern = re.compile(
-        r'\\begin\{lstlisting\}\[caption=\{(.+?)\}\]\s*(.*?)\\end\{lstlisting\}',
-        re.DOTALL
-    )
-    return pattern.sub(replace_listing, content)
+    return _RE_LSTLISTING.sub(replace_listing, content)
 
 
 def strip_titleformat(content):
     r"""Remove \titleformat commands — they're for xelatex only, pandoc misinterprets them."""
-    content = re.sub(
-        r'\\titleformat\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}\s*\{[^}]*\}',
-        '',
-        content
-    )
+    content = _RE_TITLEFORMAT.sub(b'', content)
     return content
 
 
 def strip_titlepage_content(content):
     """Strip titlepage environment and TOC commands — added back by fix_docx.py."""
     # Remove entire \begin{titlepage}...\end{titlepage}
-    content = re.sub(
-        r'\\begin\{titlepage\}.*?\\end\{titlepage\}',
-        '',
-        content,
-        flags=re.DOTALL
-    )
+    content = _RE_TITLEPAGE.sub(b'', content)
     # Remove \tableofcontents and related tocloft commands
-    content = re.sub(r'\\tableofcontents', '', content)
-    content = re.sub(r'\\renewcommand\{\\cfttoctitlefont\}.*', '', content)
-    content = re.sub(r'\\renewcommand\{\\cftaftertoctitle\}.*', '', content)
-    content = re.sub(r'\\renewcommand\{\\contentsname\}.*', '', content)
-    content = re.sub(r'\\setcounter\{page\}\{.*?\}', '', content)
-    content = re.sub(r'\\thispagestyle\{empty\}', '', content)
-    content = re.sub(r'\\newpage', '', content)
+    content = content.replace(b'\\tableofcontents', b'')
+    content = _RE_TOC_TITLEFONT.sub(b'', content)
+    content = _RE_TOC_AFTERTITLE.sub(b'', content)
+    content = _RE_CONTENTSNAME.sub(b'', content)
+    content = _RE_SETCOUNTER_PAGE.sub(b'', content)
+    content = content.replace(b'\\thispagestyle{empty}', b'')
+    content = content.replace(b'\\newpage', b'')
     return content
 
 
+def _label_deduplicator(seen):
+    """sub() callback commenting out labels already in seen (and recording new ones)."""
+    def comment_duplicate(m):
+        label = m.group(1)
+        if label in seen:
+            # Comment out duplicate label
+            return b'% duplicate: ' + m.group(0)
+        seen.add(label)
+        return m.group(0)
+
+    return comment_duplicate
+
+
 def fix_duplicate_labels(content):
     """Remove duplicate labels, keeping only the first occurrence."""
-    seen = set()
-    lines = content.split('\n')
-    result = []
-    for line in lines:
-        m = re.search(r'\\label\{([^}]+)\}', line)
-        if m:
-            label = m.group(1)
-            if label in seen:
-                # Comment out duplicate label
-                line = line.replace(f'\\label{{{label}}}', f'% duplicate: \\label{{{label}}}')
-            else:
-                seen.add(label)
-        result.append(line)
-    return '\n'.join(result)
+    return _RE_LABEL.sub(_label_deduplicator(set()), content)
 
 
-def preprocess_file(input_path, output_path, listing_counter=None):
-    """Pre-process a single .tex file."""
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+def _fix_region(region, dedup):
+    # Same order as the separate passes; each only runs if it can match
+    if b'\\_' in region:
+        region = _RE_ESCAPED_SUB.sub(_dash_escaped_underscores, region)
+    if b'\\text{' in region:
+        region = _RE_TEXT_CMD.sub(lambda m: _text_in_math(m.group(1)), region)
+    if b'_{' in region or b'^{' in region:
+        region = _RE_SUBSCRIPT.sub(_cyrillic_sub, region)
+    if b'\\label{' in region:
+        region = _RE_LABEL.sub(dedup, region)
+    return region
 
-    # Strip titlepage content (will be added by fix_docx.py post-processor)
-    if os.path.basename(input_path) == 'titlepage.tex':
-        content = strip_titlepage_content(content)
 
+def fix_inline_constructs(content):
+    """fix_escaped_underscores_in_math, fix_math_text_commands,
+    fix_cyrillic_subscripts and fix_duplicate_labels, in that order, in one scan."""
+    dedup = _label_deduplicator(set())
+
+    def dispatch(m):
+        region = m.group(0)
+        if m.lastgroup == 'cyrsub':
+            return _textrm_subscript(region)
+        return _fix_region(region, dedup)
+
+    return _RE_INLINE.sub(dispatch, content)
+
+
+def _count_listings(content):
+    """(chapter_num, number of lstlisting blocks) for one file's content."""
+    return listing_chapter(content), sum(1 for _ in _RE_LSTLISTING.finditer(content))
+
+
+def _cache_key(content, listing_counter):
+    """Cache file name for content as preprocess_file would see it."""
+    h = hashlib.blake2b(_SCRIPT_DIGEST, digest_size=16)
+    # Listing numbers are the only output that depends on more than content
+    if listing_counter is not None and b'\\begin{lstlisting}' in content:
+        start = listing_counter.get(listing_chapter(content), 0)
+        h.update(b'%d\0' % start)
+    h.update(content)
+    return h.hexdigest()
+
+
+def preprocess_file(input_path, output_path, listing_counter=None, cache_dir=None):
+    """Pre-process a single .tex file.
+
+    The file is handled as raw UTF-8 bytes: no decode/encode round trip, and
+    a Cyrillic file is not widened to a multi-byte-per-char str.
+
+    Args:
+        cache_dir: if given, output for content seen before is copied from
+            here instead of re-running the passes, and new output is stored
+    """
+    content = _read_source(input_path)
+
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, _cache_key(content, listing_counter))
+        if os.path.exists(cache_path):
+            shutil.copyfile(cache_path, output_path)
+            if listing_counter is not None and b'\\begin{lstlisting}' in content:
+                # Advance the counter as convert_lstlisting_for_pandoc would
+                chapter_num, n_listings = _count_listings(content)
+                if n_listings:
+                    listing_counter[chapter_num] = listing_counter.get(chapter_num, 0) + n_listings
+            return
+
+    # Skip passes whose literal anchors are absent (a C-level `in` per anchor)
     content = fix_figure_placement(content)
-    content = fix_escaped_underscores_in_math(content)
-    content = fix_math_text_commands(content)
-    content = fix_cyrillic_subscripts(content)
-    content = fix_duplicate_labels(content)
-    content = strip_titleformat(content)
-    if listing_counter is not None:
+    if any(anchor in content for anchor in _INLINE_ANCHORS):
+        content = fix_inline_constructs(content)
+    if b'\\titleformat' in content:
+        content = strip_titleformat(content)
+    if listing_counter is not None and b'\\begin{lstlisting}' in content:
         content = convert_lstlisting_for_pandoc(content, listing_counter)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with open(output_path, 'wb', buffering=IO_BUFFER) as f:
         f.write(content)
 
+    if cache_dir is not None:
+        # Workers may store the same key at once; each writes its own tmp
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb', buffering=IO_BUFFER) as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+
+
+def _preprocess_job(job):
+    """Worker entry point: job is (src_path, dst_path, listing_counter, cache_dir)."""
+    preprocess_file(*job)
+
+
+def _walk_tex_files(top):
+    """Yield (dir_path, .tex DirEntries sorted by name) in os.walk(top) order."""
+    tex_files = []
+    subdirs = []
+    with os.scandir(top) as it:
+        for entry in it:
+            if entry.is_dir():
+                # Like os.walk, don't descend into symlinked dirs
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.endswith('.tex'):
+                tex_files.append(entry)
+    # sorted for consistent listing numbering
+    tex_files.sort(key=lambda entry: entry.name)
+    yield top, tex_files
+    for path in subdirs:
+        yield from _walk_tex_files(path)
+
+
+def _stat_key(path):
+    """(mtime_ns, size) of path, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _load_index(index_path):
+    """Last run's {src_path: entry} record, or {} if missing or from another script."""
+    try:
+        with open(index_path, 'rb') as f:
+            script_digest, index = pickle.load(f)
+    except Exception:
+        # Missing, truncated, stale or foreign pickle: just rebuild it
+        return {}
+    if script_digest != _SCRIPT_DIGEST or not isinstance(index, dict):
+        return {}
+    # Entries are 6-tuples (see preprocess_project); drop any other shape
+    return {
+        src_path: entry for src_path, entry in index.items()
+        if isinstance(entry, tuple) and len(entry) == 6
+    }
+
+
+def _read_source(src_path):
+    """Source content as preprocess_file sees it before the passes."""
+    with open(src_path, 'rb', buffering=IO_BUFFER) as f:
+        content = f.read()
+    # Binary reads skip text mode's universal newlines; keep CRLF/CR sources
+    # coming out as LF like they did, since the patterns expect '\n' endings
+    if b'\r' in content:
+        content = content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    # Strip titlepage content (will be added by fix_docx.py post-processor)
+    if os.path.basename(src_path) == 'titlepage.tex':
+        content = strip_titlepage_content(content)
+    return content
+
 
 def preprocess_project(src_dir, out_dir):
-    """Pre-process all .tex files in the project."""
+    """Pre-process all .tex files in the project.
+
+    A source whose (mtime_ns, size) and starting listing number match the
+    last run, and whose output is still the file that run wrote, is not
+    read or rewritten at all.
+    """
     os.makedirs(out_dir, exist_ok=True)
     sections_out = os.path.join(out_dir, 'sections')
     os.makedirs(sections_out, exist_ok=True)
 
+    # Listing numbers run on across files, so assign each file its starting
+    # counter up front (in walk order); the files can then be done in any order.
+    # The passes before convert_lstlisting_for_pandoc never touch subsubsection
+    # headings or lstlisting blocks, so the raw source gives the same counts.
     listing_counter = {}  # {chapter_num: count}, shared across files
-    processed = 0
-    for root, dirs, files in os.walk(src_dir):
-        for fname in sorted(files):  # sorted for consistent listing numbering
-            if not fname.endswith('.tex'):
+    jobs = []
+    dst_dirs = set()
+    cache_dir = os.path.join(out_dir, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    live_keys = set()
+    index_path = os.path.join(out_dir, INDEX_NAME)
+    # {src_path: ((mtime_ns, size), chapter_num, n_listings, start, cache key,
+    #  output (mtime_ns, size))}
+    index = _load_index(index_path)
+    new_index = {}
+    # Every walked path starts with src_dir + sep, so slicing that off gives
+    # the relative path without os.path.relpath's normalisation per file
+    src_prefix = len(os.path.join(src_dir, ''))
+    for root, entries in _walk_tex_files(src_dir):
+        if not entries:
+            continue
+        # Preserve relative path structure
+        dst_root = os.path.join(out_dir, root[src_prefix:])
+        dst_dirs.add(dst_root)
+        for entry in entries:
+            src_path = entry.path
+            dst_path = os.path.join(dst_root, entry.name)
+
+            st = entry.stat()
+            src_stat = (st.st_mtime_ns, st.st_size)
+            prev = index.get(src_path)
+            if prev is not None and prev[0] == src_stat:
+                content = None
+                chapter_num, n_listings = prev[1], prev[2]
+            else:
+                content = _read_source(src_path)
+                chapter_num, n_listings = _count_listings(content)
+            start = {chapter_num: listing_counter.get(chapter_num, 0)}
+            if n_listings:
+                listing_counter[chapter_num] = start[chapter_num] + n_listings
+
+            if content is None and prev[3] != start[chapter_num]:
+                # Unchanged file, but an earlier one shifted its numbering
+                content = _read_source(src_path)
+            key = prev[4] if content is None else _cache_key(content, start)
+            live_keys.add(key)
+            record = (src_stat, chapter_num, n_listings, start[chapter_num], key)
+            if content is None and _stat_key(dst_path) == prev[5]:
+                new_index[src_path] = prev
+            else:
+                new_index[src_path] = record
+                jobs.append((src_path, dst_path, start, cache_dir))
+
+    # Create every output dir up front so the writes below are just writes
+    for dst_dir in sorted(dst_dirs):
+        os.makedirs(dst_dir, exist_ok=True)
+
+    if len(jobs) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor() as executor:
+            list(executor.map(_preprocess_job, jobs, chunksize=8))
+    else:
+        for job in jobs:
+            _preprocess_job(job)
+    processed = len(new_index)
+
+    # Record what was written, for the next run's skip check
+    for src_path, dst_path, _, _ in jobs:
+        new_index[src_path] += (_stat_key(dst_path),)
+    if new_index != index:
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((_SCRIPT_DIGEST, new_index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+
+    # Drop output cached for content no source file has any more
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name not in live_keys:
+                os.remove(entry.path)
+
+    # Link images from src to preprocessed dir: hardlink where the filesystem
+    # allows it, symlink otherwise
+    with os.scandir(out_dir) as it:
+        existing = {dst_entry.name: dst_entry for dst_entry in it}
+    src_abs = os.path.abspath(src_dir)  # one getcwd() for all the symlinks
+    with os.scandir(src_dir) as it:
+        for entry in it:
+            if not entry.name.lower().endswith(IMAGE_EXTS):
                 continue
-            src_path = os.path.join(root, fname)
-            # Preserve relative path structure
-            rel = os.path.relpath(src_path, src_dir)
-            dst_path = os.path.join(out_dir, rel)
-            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-            preprocess_file(src_path, dst_path, listing_counter)
-            processed += 1
-
-    # Symlink images from src to preprocessed dir
-    for f in os.listdir(src_dir):
-        ext = os.path.splitext(f)[1].lower()
-        if ext in ('.png', '.jpg', '.jpeg', '.gif', '.svg'):
-            src_img = os.path.join(src_dir, f)
-            dst_img = os.path.join(out_dir, f)
-            if not os.path.exists(dst_img):
-                os.symlink(os.path.abspath(src_img), dst_img)
+            dst_img = os.path.join(out_dir, entry.name)
+            dst_entry = existing.get(entry.name)
+            if dst_entry is not None:
+                # A hardlink keeps the old inode when the source is replaced
+                # (unzip -o, git checkout, editors that rename), so only a
+                # link to the current file counts as up to date. DirEntry
+                # caches each stat, so this costs at most one per side.
+                try:
+                    fresh = os.path.samestat(entry.stat(), dst_entry.stat())
+                except OSError:
+                    fresh = False  # dangling symlink
+                if fresh:
+                    continue
+                os.remove(dst_img)
+            try:
+                os.link(entry.path, dst_img)
+            except OSError:
+                os.symlink(os.path.join(src_abs, entry.name), dst_img)
 
     return processed
 